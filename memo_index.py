@@ -0,0 +1,42 @@
+"""
+Memo index layout shared by the bulk loader (post_memo_to_opensearch.py) and
+the search client (opensearch_client.py). Keep this module dependency-free so
+both can import it.
+"""
+import re
+from typing import Any
+
+# Lucene rejects terms over 32766 bytes; 8191 chars stays under it even at 4 bytes/char
+KEYWORD_IGNORE_ABOVE = 8191
+
+MEMO_MAPPINGS = {
+    "properties": {
+        "memoId": {"type": "keyword", "ignore_above": KEYWORD_IGNORE_ABOVE},
+        "clientName": {
+            "type": "text",
+            "fields": {"keyword": {"type": "keyword", "ignore_above": KEYWORD_IGNORE_ABOVE}},
+        },
+        "clientID": {"type": "keyword", "ignore_above": KEYWORD_IGNORE_ABOVE},
+        "industry": {"type": "keyword", "ignore_above": KEYWORD_IGNORE_ABOVE},
+        "sector": {"type": "keyword", "ignore_above": KEYWORD_IGNORE_ABOVE},
+        "region": {"type": "keyword", "ignore_above": KEYWORD_IGNORE_ABOVE},
+        "currency": {"type": "keyword", "ignore_above": KEYWORD_IGNORE_ABOVE},
+        "businessDescription": {"type": "text"},
+        "executiveSummary": {"type": "text"},
+        "proposedCommitments": {"type": "text"},
+        "riskFactors": {"type": "text"},
+        "lendingThesis": {"type": "text"},
+        "environmentalRisks": {"type": "text"},
+        "keyCommitteeDiscussionPoints": {"type": "text"},
+    }
+}
+
+
+def partition_suffix(value: Any) -> str:
+    """Index-name-safe partition suffix for a memo field value"""
+    return re.sub(r"[^a-z0-9]+", "-", str(value or "").lower()).strip("-") or "unknown"
+
+
+def partition_index(alias: str, value: Any) -> str:
+    """Concrete partition index behind `alias` for a memo field value"""
+    return f"{alias}-{partition_suffix(value)}"
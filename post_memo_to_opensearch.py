@@ -1,7 +1,36 @@
+import argparse
 import json
 import os
 import requests
-from typing import List, Any
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Any, Optional, Iterable, Iterator, Dict
+
+from memo_index import MEMO_MAPPINGS, partition_index, partition_suffix
+
+# orjson emits bytes directly and is much faster on the long memo text
+# fields; fall back to ujson, then stdlib json.
+try:
+    import orjson
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:
+    try:
+        import ujson
+
+        def _dumps(obj: Any) -> bytes:
+            return ujson.dumps(obj, ensure_ascii=False).encode("utf-8")
+    except ImportError:
+        def _dumps(obj: Any) -> bytes:
+            return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# ijson parses memo.json incrementally; without it the file is loaded whole.
+try:
+    import ijson
+except ImportError:
+    ijson = None
 
 
 # ----------------------------
@@ -9,6 +38,40 @@ from typing import List, Any
 # ----------------------------
 OPENSEARCH_URL = os.getenv("OPENSEARCH_URL", "http://localhost:9200")
 MEMO_INDEX = os.getenv("MEMO_INDEX", "memo")
+BULK_MAX_BATCH_BYTES = 5 * 1024 * 1024
+# per-thread doc flush size for partitioned loads
+BULK_BATCH_SIZE = int(os.getenv("MEMO_BULK_BATCH_SIZE", "200"))
+PARTITION_WORKERS = 4
+# Shard count is fixed at index creation (changing it needs a reindex/split);
+# replicas start at 0 for the load and are raised to MEMO_REPLICAS_FINAL after.
+# The default of 1 replica leaves the single-node docker-compose cluster yellow
+# (the replica can't be assigned); set MEMO_REPLICAS_FINAL=0 there.
+MEMO_SHARDS = int(os.getenv("MEMO_SHARDS", "3"))
+MEMO_REPLICAS_FINAL = int(os.getenv("MEMO_REPLICAS_FINAL", "1"))
+# Long free-text fields are cut to this many characters before indexing (0 = off)
+MEMO_MAX_TEXT_LEN = int(os.getenv("MEMO_MAX_TEXT_LEN", "8192"))
+LONG_TEXT_FIELDS = (
+    "businessDescription",
+    "executiveSummary",
+    "proposedCommitments",
+    "riskFactors",
+    "lendingThesis",
+    "environmentalRisks",
+    "keyCommitteeDiscussionPoints",
+)
+
+
+# One keep-alive session for every call; bulk requests override Content-Type.
+# Retry only covers idempotent methods (urllib3 default), so POSTs aren't replayed.
+_SESSION = requests.Session()
+_SESSION.headers.update({"Content-Type": "application/json"})
+_ADAPTER = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
 
 
 # ----------------------------
@@ -16,55 +79,45 @@ MEMO_INDEX = os.getenv("MEMO_INDEX", "memo")
 # ----------------------------
 def os_request(method: str, path: str, body: Any = None) -> requests.Response:
     url = f"{OPENSEARCH_URL.rstrip('/')}/{path.lstrip('/')}"
-    headers = {"Content-Type": "application/json"}
-    data = json.dumps(body) if body is not None else None
-    resp = requests.request(method, url, headers=headers, data=data, timeout=60)
+    data = _dumps(body) if body is not None else None
+    resp = _SESSION.request(method, url, data=data, timeout=60)
     return resp
 
 
-def ensure_index() -> None:
-    """Create the memo index if it doesn't exist"""
+def ensure_index(suffix: Optional[str] = None) -> str:
+    """
+    Create the memo index if it doesn't exist and return its name.
+
+    With a suffix, creates the partition index <MEMO_INDEX>-<suffix> and adds
+    it to the MEMO_INDEX alias, so searches against MEMO_INDEX cover every
+    partition. The alias has no write index: single-document reads/writes on
+    MEMO_INDEX fail unless the client is built with partition_field=<FIELD>,
+    which routes them to the right partition (creating missing partitions
+    with the same mapping and alias).
+    """
+    index = MEMO_INDEX if suffix is None else partition_index(MEMO_INDEX, suffix)
     memo_mapping = {
-        "settings": {"number_of_shards": 1, "number_of_replicas": 0},
-        "mappings": {
-            "properties": {
-                "memoId": {"type": "keyword"},
-                "clientName": {"type": "text", "fields": {"keyword": {"type": "keyword"}}},
-                "clientID": {"type": "keyword"},
-                "industry": {"type": "keyword"},
-                "sector": {"type": "keyword"},
-                "region": {"type": "keyword"},
-                "currency": {"type": "keyword"},
-                "businessDescription": {"type": "text"},
-                "executiveSummary": {"type": "text"},
-                "proposedCommitments": {"type": "text"},
-                "riskFactors": {"type": "text"},
-                "lendingThesis": {"type": "text"},
-                "environmentalRisks": {"type": "text"},
-                "keyCommitteeDiscussionPoints": {"type": "text"},
-            }
-        },
+        # refresh and replicas stay off for the initial load; main() restores them afterwards
+        "settings": {"number_of_shards": MEMO_SHARDS, "number_of_replicas": 0, "refresh_interval": "-1"},
+        "mappings": MEMO_MAPPINGS,
     }
 
-    r = os_request("HEAD", MEMO_INDEX)
+    if suffix is not None:
+        memo_mapping["aliases"] = {MEMO_INDEX: {}}
+
+    r = os_request("HEAD", index)
     if r.status_code == 404:
-        cr = os_request("PUT", MEMO_INDEX, memo_mapping)
+        cr = os_request("PUT", index, memo_mapping)
         cr.raise_for_status()
-        print(f"Created index: {MEMO_INDEX}")
+        print(f"Created index: {index}")
     elif r.ok:
-        print(f"Index exists: {MEMO_INDEX}")
+        print(f"Index exists: {index}")
     else:
         r.raise_for_status()
+    return index
 
 
-def bulk_index(ndjson_lines: List[str]) -> None:
-    """Bulk index documents using NDJSON format"""
-    url = f"{OPENSEARCH_URL.rstrip('/')}/_bulk"
-    headers = {"Content-Type": "application/x-ndjson"}
-    payload = "\n".join(ndjson_lines) + "\n"
-    resp = requests.post(url, headers=headers, data=payload.encode("utf-8"), timeout=120)
-    resp.raise_for_status()
-    result = resp.json()
+def _raise_bulk_errors(result: dict) -> None:
     if result.get("errors"):
         # Print first few errors to help debug
         items = result.get("items", [])
@@ -78,48 +131,177 @@ def bulk_index(ndjson_lines: List[str]) -> None:
         raise RuntimeError(f"Bulk indexing had errors. Sample: {json.dumps(errors, indent=2)}")
 
 
-def memo_to_bulk_lines(memo: dict) -> List[str]:
-    """Convert a memo document to bulk index NDJSON lines"""
-    lines: List[str] = []
-    memo_id = memo["memoId"]
-    
+def _bulk_batches(
+    memos: Iterable[dict],
+    index: str,
+    max_batch_bytes: int,
+    max_batch_docs: Optional[int] = None,
+) -> Iterator[List[bytes]]:
+    """Group encoded bulk lines into batches of at most ~max_batch_bytes (and max_batch_docs)"""
+    batch: List[bytes] = []
+    batch_bytes = 0
+    for memo in memos:
+        lines = list(memo_to_bulk_bytes(memo, index))
+        size = sum(len(line) for line in lines)
+        full = max_batch_docs is not None and len(batch) // 2 >= max_batch_docs
+        if batch and (full or batch_bytes + size > max_batch_bytes):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.extend(lines)
+        batch_bytes += size
+    if batch:
+        yield batch
+
+
+def bulk_index(
+    memos: Iterable[dict],
+    index: str = MEMO_INDEX,
+    max_batch_bytes: int = BULK_MAX_BATCH_BYTES,
+    max_batch_docs: Optional[int] = None,
+) -> int:
+    """
+    Bulk index memos using NDJSON format.
+
+    Memos are sent in sub-batches of ~max_batch_bytes (kept well under the
+    default 10 MB http.max_content_length), optionally also capped at
+    max_batch_docs; each batch body is streamed as pre-encoded lines rather
+    than joined into one string. Returns the number of memos indexed.
+    """
+    url = f"{OPENSEARCH_URL.rstrip('/')}/_bulk"
+    headers = {"Content-Type": "application/x-ndjson"}
+    indexed = 0
+    for batch in _bulk_batches(memos, index, max_batch_bytes, max_batch_docs):
+        resp = _SESSION.post(url, headers=headers, data=iter(batch), timeout=120)
+        resp.raise_for_status()
+        _raise_bulk_errors(resp.json())
+        indexed += len(batch) // 2
+    return indexed
+
+
+def normalize_memo(memo: dict, max_len: int = MEMO_MAX_TEXT_LEN) -> dict:
+    """
+    Truncate long free-text fields to max_len characters (at a word boundary
+    where possible) to keep postings and _source small.
+
+    Tradeoff: text past the cut is neither searchable, highlightable nor
+    returned in _source. Set MEMO_MAX_TEXT_LEN=0 to index full text.
+    """
+    if max_len <= 0:
+        return memo
+    truncated = {}
+    for field in LONG_TEXT_FIELDS:
+        value = memo.get(field)
+        if isinstance(value, str) and len(value) > max_len:
+            cut = value[:max_len]
+            truncated[field] = cut.rsplit(" ", 1)[0] if " " in cut else cut
+    return {**memo, **truncated} if truncated else memo
+
+
+def memo_to_bulk_bytes(memo: dict, index: str = MEMO_INDEX) -> Iterator[bytes]:
+    """Yield the NDJSON action + source lines for a memo, each ending in a newline"""
     # Index action + document
-    lines.append(json.dumps({"index": {"_index": MEMO_INDEX, "_id": memo_id}}))
-    lines.append(json.dumps(memo))
-    
-    return lines
+    yield _dumps({"index": {"_index": index, "_id": memo["memoId"]}}) + b"\n"
+    yield _dumps(normalize_memo(memo)) + b"\n"
 
 
-def main() -> None:
-    # Ensure index exists
-    ensure_index()
-    
+def iter_memos(memo_file: str) -> Iterator[dict]:
+    """Yield memos from a JSON array file, streaming the parse when ijson is available"""
+    with open(memo_file, "rb") as f:
+        if ijson is not None:
+            # use_float: plain floats instead of Decimal, which the encoders can't take
+            yield from ijson.items(f, "item", use_float=True)
+        else:
+            yield from json.load(f)
+
+
+def partition_memos(memos: Iterable[dict], field: str) -> Dict[str, List[dict]]:
+    """Group memos by the partition suffix of memo[field]"""
+    partitions: Dict[str, List[dict]] = {}
+    for memo in memos:
+        partitions.setdefault(partition_suffix(memo.get(field)), []).append(memo)
+    return partitions
+
+
+def bulk_index_partitions(partitions: Dict[str, List[dict]], max_workers: int = PARTITION_WORKERS) -> int:
+    """Bulk index {index: memos} concurrently, one worker per partition index"""
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [
+            pool.submit(bulk_index, memos, index, max_batch_docs=BULK_BATCH_SIZE)
+            for index, memos in partitions.items()
+        ]
+        return sum(f.result() for f in futures)
+
+
+def put_index_settings(settings: dict) -> None:
+    """Update dynamic index settings (applies to every partition via the alias)"""
+    r = os_request("PUT", f"{MEMO_INDEX}/_settings", {"index": settings})
+    r.raise_for_status()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Bulk load memo.json into OpenSearch")
+    parser.add_argument(
+        "--keep-refresh-off",
+        action="store_true",
+        help="leave refresh_interval at -1 and replicas at 0 after loading (for chained batch loads); "
+             "the last load in the chain should run without this flag",
+    )
+    parser.add_argument(
+        "--partition-by",
+        metavar="FIELD",
+        help="load into one <index>-<value> index per distinct memo FIELD value "
+             "(e.g. region), in parallel, behind an alias named after the index; "
+             "the index name must not already exist as a regular index. "
+             "Limits: the whole file is held in memory to group it (no streaming), and "
+             "MemoOpenSearchClient needs partition_field=FIELD for get/upsert/update/delete",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = parse_args(argv)
+
     # Read memo.json
     memo_file = "memo.json"
     if not os.path.exists(memo_file):
         raise FileNotFoundError(f"File not found: {memo_file}")
+
+    # Ensure index (or partition indices + alias) exists
+    if args.partition_by:
+        partitions = {
+            ensure_index(suffix): memos
+            for suffix, memos in partition_memos(iter_memos(memo_file), args.partition_by).items()
+        }
+        if not partitions:
+            print(f"No memos found in {memo_file}")
+            return
+    else:
+        ensure_index()
     
-    with open(memo_file, "r", encoding="utf-8") as f:
-        memos = json.load(f)
-    
-    print(f"Loaded {len(memos)} memos from {memo_file}")
-    
-    # Convert all memos to bulk index format
-    all_bulk_lines: List[str] = []
-    for memo in memos:
-        all_bulk_lines.extend(memo_to_bulk_lines(memo))
-        print(f"Prepared {memo['memoId']} - {memo['clientName']}")
-    
-    # Bulk index all documents
-    if all_bulk_lines:
-        print(f"\nIndexing {len(memos)} documents to {MEMO_INDEX}...")
-        bulk_index(all_bulk_lines)
-        print(f"✅ Successfully indexed {len(memos)} documents")
-        
-        # Refresh the index to make documents searchable immediately
-        refresh_resp = os_request("POST", f"{MEMO_INDEX}/_refresh")
-        if refresh_resp.ok:
-            print("✅ Index refreshed")
+    # Periodic refreshes during the load only create segments to merge later,
+    # and replicas would index every doc twice; also covers pre-existing indices
+    put_index_settings({"refresh_interval": "-1", "number_of_replicas": 0})
+
+    print(f"\nIndexing memos from {memo_file} to {MEMO_INDEX}...")
+    try:
+        if args.partition_by:
+            indexed = bulk_index_partitions(partitions)
+        else:
+            # memos are parsed, encoded and sent batch by batch, never all held at once
+            indexed = bulk_index(iter_memos(memo_file))
+        print(f"✅ Successfully indexed {indexed} documents")
+    finally:
+        # restore even when the load fails, so batches that landed become visible
+        if args.keep_refresh_off:
+            print("Refresh and replicas left disabled (--keep-refresh-off)")
+        else:
+            # replicas are copied from the finished primaries instead of
+            # re-indexing every doc during the load
+            put_index_settings({"refresh_interval": "1s", "number_of_replicas": MEMO_REPLICAS_FINAL})
+            # Refresh the index to make documents searchable immediately
+            refresh_resp = os_request("POST", f"{MEMO_INDEX}/_refresh")
+            if refresh_resp.ok:
+                print("✅ Index refreshed")
     
     # Verify count
     r = os_request("GET", f"{MEMO_INDEX}/_count")
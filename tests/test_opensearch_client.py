@@ -0,0 +1,201 @@
+import json
+import re
+
+import pytest
+
+pytest.importorskip("opensearchpy")
+pytest.importorskip("pydantic")
+
+from opensearchpy.exceptions import ConnectionError, RequestError  # noqa: E402
+
+from opensearch_client import MemoOpenSearchClient  # noqa: E402
+
+
+@pytest.fixture
+def client():
+    # constructing the client opens no connections
+    return MemoOpenSearchClient(hosts=[{"host": "localhost", "port": 9200}], index_name="memo")
+
+
+def test_criteria_only_request_is_constant_score_and_byte_stable(client):
+    req = client.build_agent_request(industry=["Healthcare"], region=["India"]).model_dump(by_alias=True)
+
+    first = client.build_bool_query_bytes(req)
+    # same request, keys in a different order, built without the cache
+    MemoOpenSearchClient._bool_query_cached.cache_clear()
+    reordered = dict(reversed(list(req.items())))
+    reordered["criteria"] = dict(reversed(list(req["criteria"].items())))
+    again = client.build_bool_query_bytes(reordered)
+
+    assert first == again
+    assert json.loads(first) == {
+        "constant_score": {
+            "filter": {
+                "bool": {
+                    "filter": [
+                        {"terms": {"industry": ["Healthcare"]}},
+                        {"terms": {"region": ["India"]}},
+                    ]
+                }
+            }
+        }
+    }
+
+
+def test_mixed_request_keeps_bool_shape(client):
+    req = client.build_agent_request(
+        industry=["Healthcare"],
+        query=["Fuel price movements", "Customer concentration"],
+    ).model_dump(by_alias=True)
+
+    query = json.loads(client.build_bool_query_bytes(req))
+
+    assert query == {
+        "bool": {
+            "filter": [{"terms": {"industry": ["Healthcare"]}}],
+            "must": [],
+            "should": [
+                {
+                    "multi_match": {
+                        "query": "Fuel price movements Customer concentration",
+                        "fields": ["riskFactors", "keyCommitteeDiscussionPoints"],
+                        "type": "best_fields",
+                        "operator": "or",
+                    }
+                }
+            ],
+            "minimum_should_match": 1,
+        }
+    }
+
+
+def _render(source, params):
+    """Minimal mustache rendering for the tags the agent template uses"""
+    source = re.sub(r"\{\{#toJson\}\}(\w+)\{\{/toJson\}\}", lambda m: json.dumps(params[m.group(1)]), source)
+
+    def value(m):
+        v = params[m.group(1)]
+        # strings sit inside quotes in the template and are JSON-escaped
+        return json.dumps(v)[1:-1] if isinstance(v, str) else json.dumps(v)
+
+    return re.sub(r"\{\{(\w+)\}\}", value, source)
+
+
+@pytest.mark.parametrize("industry,region,query", [
+    (["Healthcare", "Industrials"], ["India"], ["Fuel price movements", 'Customer "concentration"']),
+    ([], [], ["Supply chain disruptions"]),
+])
+def test_agent_template_renders_to_search_body(client, industry, region, query):
+    params = client._agent_template_params(industry, region, [], query, 7, False)
+    rendered = json.loads(_render(client.agent_search_template_source(), params))
+
+    req = client.build_agent_request(industry, region, [], query, 7).model_dump(by_alias=True)
+    assert rendered == json.loads(client._search_body(req, facets=False))
+    assert rendered["query"] == json.loads(client.build_bool_query_bytes(req))
+
+
+def test_agent_search_falls_back_when_template_is_refused(client, monkeypatch):
+    def refuse(**kwargs):
+        raise RequestError(400, "illegal_argument_exception", "cannot execute scripts using [search] context")
+
+    calls = []
+
+    def perform(method, path, **kwargs):
+        calls.append(path)
+        return {"hits": {"hits": []}}
+
+    monkeypatch.setattr(client.client, "put_script", refuse)
+    monkeypatch.setattr(client.client.transport, "perform_request", perform)
+
+    client.agent_search(industry=[], region=[], currency=[], query=["Fuel price movements"])
+    client.agent_search(industry=[], region=[], currency=[], query=["Fuel price movements"])
+
+    assert calls == ["/memo/_search", "/memo/_search"]
+
+
+def test_agent_search_retries_template_after_connection_error(client, monkeypatch):
+    attempts = []
+
+    def flaky(**kwargs):
+        attempts.append(kwargs["id"])
+        if len(attempts) == 1:
+            raise ConnectionError("N/A", "connection refused", None)
+        return {"acknowledged": True}
+
+    calls = []
+
+    def perform(method, path, **kwargs):
+        calls.append(path)
+        return {"hits": {"hits": []}}
+
+    monkeypatch.setattr(client.client, "put_script", flaky)
+    monkeypatch.setattr(client.client.transport, "perform_request", perform)
+
+    client.agent_search(industry=[], region=[], currency=[], query=["Fuel price movements"])
+    client.agent_search(industry=[], region=[], currency=[], query=["Fuel price movements"])
+
+    assert len(attempts) == 2
+    assert calls == ["/memo/_search", "/memo/_search/template"]
+
+
+def test_partitioned_client_routes_single_doc_operations(monkeypatch):
+    client = MemoOpenSearchClient(
+        hosts=[{"host": "localhost", "port": 9200}], index_name="memo", partition_field="region"
+    )
+    calls = []
+
+    bodies = {}
+
+    def perform(method, path, body=None, **kwargs):
+        calls.append((method, path))
+        bodies[(method, path)] = body
+        if method == "HEAD":
+            return False  # partition index doesn't exist yet
+        if path == "/memo/_search":
+            return {"hits": {"hits": [{"_index": "memo-north-america", "_id": "MEMO-001"}]}}
+        return {}
+
+    monkeypatch.setattr(client.client.transport, "perform_request", perform)
+
+    client.upsert_memo("MEMO-001", {"memoId": "MEMO-001", "region": "North America"})
+    client.upsert_memo("MEMO-002", {"memoId": "MEMO-002", "region": "North America"})
+    client.delete_memo("MEMO-001")
+
+    assert calls == [
+        ("HEAD", "/memo-north-america"),
+        ("PUT", "/memo-north-america"),
+        ("PUT", "/memo-north-america/_doc/MEMO-001"),
+        ("PUT", "/memo-north-america/_doc/MEMO-002"),
+        ("POST", "/memo/_search"),
+        ("DELETE", "/memo-north-america/_doc/MEMO-001"),
+    ]
+    created = bodies[("PUT", "/memo-north-america")]
+    assert created["aliases"] == {"memo": {}}
+    assert created["mappings"]["properties"]["region"]["type"] == "keyword"
+
+
+def test_search_many_as_aggs_with_no_queries_sends_nothing(client, monkeypatch):
+    def perform(*args, **kwargs):
+        raise AssertionError("no request expected")
+
+    monkeypatch.setattr(client.client.transport, "perform_request", perform)
+
+    assert client.search_many_as_aggs([], "riskFactors") == {"counts": {}, "raw": None}
+
+
+@pytest.mark.parametrize("facets,path", [(False, "/memo/_search/template"), (True, "/memo/_search")])
+def test_agent_search_result_always_has_query(client, monkeypatch, facets, path):
+    calls = []
+
+    def perform(method, path, **kwargs):
+        calls.append(path)
+        return {"hits": {"hits": []}}
+
+    monkeypatch.setattr(client.client, "put_script", lambda **kwargs: {"acknowledged": True})
+    monkeypatch.setattr(client.client.transport, "perform_request", perform)
+
+    resp = client.agent_search(industry=[], region=[], currency=[], query=["Fuel price movements"], facets=facets)
+
+    assert calls == [path]
+    assert isinstance(resp["query"], dict)
+    json.dumps(resp["query"])